@@ -2,25 +2,132 @@
 Provides tools for common operations with Gmail (e.g., send_mail)
 """
 
+import asyncio
 import os
-from base64 import urlsafe_b64encode
-from typing import Any, Optional, Dict
-from email.message import EmailMessage
-
+import threading
+from functools import lru_cache
+from base64 import encodebytes
+from typing import Any, Optional, Dict, Iterator
+from email.header import Header
+from email.utils import formataddr, getaddresses
+
+import requests
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.http import MediaInMemoryUpload, build_http
 
 from mcp.server.fastmcp import FastMCP
 
+try:
+    # SIMD-accelerated base64 decode; falls back to the stdlib implementation
+    from pybase64 import urlsafe_b64decode
+except ImportError:
+    from base64 import urlsafe_b64decode
+
+# base64 padding to append, indexed by len(data) % 4
+_PAD = (b"", b"===", b"==", b"=")
+
+# Shared session so backend calls reuse pooled keep-alive connections
+_backend_session = requests.Session()
+_backend_session.headers.update({"User-Agent": "gmail-mcp/1"})
+
+# Partial-response selectors for get_latest_message. Parts are expanded _PARTS_DEPTH levels deep
+# (e.g. text/plain in alternative in mixed in a forwarded message/rfc822, and one more); the
+# deepest level also selects its children's mimeType so a truncated tree can be detected.
+_PARTS_DEPTH = 5
+_PART_FIELDS = "mimeType,body/data"
+_PARTS_SELECTOR = "parts(mimeType)"
+for _ in range(_PARTS_DEPTH):
+    _PARTS_SELECTOR = f"parts({_PART_FIELDS},{_PARTS_SELECTOR})"
+_LATEST_MESSAGE_FIELDS = f"id,snippet,payload(headers(name,value),{_PART_FIELDS},{_PARTS_SELECTOR})"
+_LATEST_MESSAGE_HEADER_FIELDS = "id,snippet,payload(headers(name,value))"
+
+# Bodies larger than this (decoded size) are returned undecoded as body_b64url
+_MAX_DECODED_BODY = 64 * 1024
+
+# Gmail's per-request cap on messages.batchModify ids
+_BATCH_MODIFY_LIMIT = 1000
+
 mcp = FastMCP(
     "gmail-mcp-server",
     instructions="Provides tools for common operations with Gmail (e.g., send_mail)",
 )
 
-def _b64url_decode(data_b64: str) -> bytes:
-    # base64url decode with padding
-    padded = data_b64 + "=" * ((4 - len(data_b64) % 4) % 4)
-    return urlsafe_b64encode(b"").__class__(b"") if False else __import__('base64').urlsafe_b64decode(padded)
+# RFC 5322 recommended maximum header line length, excluding CRLF
+_MAX_HEADER_LINE = 78
+
+def _encode_subject(subject: str) -> str:
+    # Short ASCII subjects go in verbatim; longer ones are folded with CRLF at whitespace.
+    # Non-ASCII subjects, and ASCII ones with unbreakable runs, become RFC 2047 encoded-words.
+    if subject.isascii():
+        if len("Subject: ") + len(subject) <= _MAX_HEADER_LINE:
+            return subject
+        folded = Header(subject, "us-ascii", header_name="Subject").encode(linesep="\r\n")
+        if all(len(line) <= _MAX_HEADER_LINE for line in folded.split("\r\n")):
+            return folded
+    return Header(subject, "utf-8", header_name="Subject").encode(linesep="\r\n")
+
+def _encode_addresses(addresses: str) -> str:
+    # one address per folded line keeps long recipient lists within the header line limit
+    pairs = getaddresses([addresses])
+    for _, addr in pairs:
+        if not addr.isascii():
+            raise ValueError(f"Non-ASCII email address not supported: {addr}")
+    return ",\r\n ".join(formataddr(pair, charset="utf-8") for pair in pairs)
+
+def _build_mime(to: str, subject: str, body: str, cc: Optional[str] = None, bcc: Optional[str] = None) -> bytes:
+    """
+    Assembles a text/plain RFC 5322 message directly, bypassing the email.generator machinery.
+    """
+    for value in (to, subject, cc, bcc):
+        if value and ("\r" in value or "\n" in value):
+            raise ValueError("Header values may not contain linefeed or carriage return characters")
+    headers = f"To: {_encode_addresses(to)}\r\n"
+    if cc:
+        headers += f"Cc: {_encode_addresses(cc)}\r\n"
+    if bcc:
+        headers += f"Bcc: {_encode_addresses(bcc)}\r\n"
+    headers += (
+        f"Subject: {_encode_subject(subject)}\r\n"
+        "MIME-Version: 1.0\r\n"
+        "Content-Type: text/plain; charset=utf-8\r\n"
+        "Content-Transfer-Encoding: base64\r\n"
+        "\r\n"
+    )
+    # encodebytes ends its 76-char lines with a bare LF; use CRLF throughout
+    return headers.encode("ascii") + encodebytes(body.encode("utf-8")).replace(b"\n", b"\r\n")
+
+def _walk_parts(part: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    # depth-first traversal of a Gmail message payload and its nested parts
+    yield part
+    for child in part.get("parts") or ():
+        yield from _walk_parts(child)
+
+def _has_parts_below(part: Dict[str, Any], depth: int) -> bool:
+    # whether any part `depth` levels below this one has children of its own
+    if depth == 0:
+        return bool(part.get("parts"))
+    return any(_has_parts_below(child, depth - 1) for child in part.get("parts") or ())
+
+def _find_text_part(payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    # first text/plain part, depth-first; single-part messages use their own body
+    text_part = next(
+        (p for p in _walk_parts(payload) if p.get("mimeType") == "text/plain" and p.get("body", {}).get("data")),
+        None,
+    )
+    if text_part is None and not payload.get("parts"):
+        text_part = payload
+    return text_part
+
+@lru_cache(maxsize=None)
+def _gmail_discovery_doc() -> str:
+    # Discovery document bundled with google-api-python-client; read once, never fetched over HTTP
+    doc = get_static_doc("gmail", "v1")
+    if doc is None:
+        raise RuntimeError("Gmail v1 discovery document not bundled with google-api-python-client")
+    return doc
 
 class GoogleClient:
     """Encapsulates a Gmail API client."""
@@ -32,19 +139,46 @@ class GoogleClient:
             client_id=client_id,
             client_secret=client_secret,
         )
-        self.gmail = build("gmail", "v1", credentials=self._creds, cache_discovery=False)
+        self.gmail = build_from_document(_gmail_discovery_doc(), credentials=self._creds)
+        # leaf resources resolved once instead of per call
+        self.messages = self.gmail.users().messages()
+        self.labels = self.gmail.users().labels()
+        self._local = threading.local()
+
+    def _http(self) -> AuthorizedHttp:
+        # httplib2.Http is not thread-safe: keep one authorized connection per worker thread
+        http = getattr(self._local, "http", None)
+        if http is None:
+            http = self._local.http = AuthorizedHttp(self._creds, http=build_http())
+        return http
+
+    async def execute(self, request) -> Any:
+        """Runs a blocking Gmail API request in a worker thread so the event loop stays responsive."""
+        return await asyncio.to_thread(lambda: request.execute(http=self._http()))
+
+# Process environment credentials never change at runtime, so read them once
+_ENV_CREDS = (os.environ.get("CLIENT_ID"), os.environ.get("CLIENT_SECRET"), os.environ.get("REFRESH_TOKEN"))
+
+@lru_cache(maxsize=8)
+def _build_client(client_id: str, client_secret: str, refresh_token: str) -> GoogleClient:
+    # Credentials refresh their access token in place, so a client can be reused across calls
+    return GoogleClient(client_id, client_secret, refresh_token)
 
 def get_google_client(env_override: Optional[Dict[str, str]] = None) -> GoogleClient:
     """
-    Constructs a GoogleClient using parameters from env_override (if provided), else from environment variables.
+    Returns a GoogleClient using parameters from env_override (if provided), else from environment variables
+    (read once at import).
+    Clients are cached per credential tuple so the discovery document and HTTP session are reused.
     """
-    source = env_override if env_override is not None else os.environ
-    client_id = source.get("CLIENT_ID")
-    client_secret = source.get("CLIENT_SECRET")
-    refresh_token = source.get("REFRESH_TOKEN")
+    if env_override is None:
+        client_id, client_secret, refresh_token = _ENV_CREDS
+    else:
+        client_id = env_override.get("CLIENT_ID")
+        client_secret = env_override.get("CLIENT_SECRET")
+        refresh_token = env_override.get("REFRESH_TOKEN")
     if not (client_id and client_secret and refresh_token):
         raise RuntimeError("Required Google OAuth credentials not found in environment or env_override parameter")
-    return GoogleClient(client_id, client_secret, refresh_token)
+    return _build_client(client_id, client_secret, refresh_token)
 
 @mcp.tool(name="send_mail", description="Send a new email to recipient(s) with a subject and body")
 async def send_mail(
@@ -67,33 +201,19 @@ async def send_mail(
     :returns: Dict with 'content' list or error flag.
     """
     try:
-        # Build MIME message using EmailMessage to ensure proper UTF-8 encoding
-        msg = EmailMessage()
-        msg['To'] = to
-        if cc:
-            msg['Cc'] = cc
-        if bcc:
-            msg['Bcc'] = bcc
-        msg['Subject'] = subject
-        # Plain text body with utf-8 charset. If HTML is needed, use add_alternative.
-        msg.set_content(body, subtype='plain', charset='utf-8')
-
-        # as_bytes() will include proper headers and charset; encode to base64url without padding
-        raw = urlsafe_b64encode(msg.as_bytes()).decode('ascii').rstrip('=')
+        # Assemble the MIME bytes directly
+        mime_bytes = _build_mime(to, subject, body, cc, bcc)
 
         # get google client (from env_override or os.environ)
         google_client = get_google_client(env_override)
 
-        # send via Gmail API
-        sent = (
-            google_client.gmail
-            .users()
-            .messages()
-            .send(
+        # send via the Gmail upload endpoint (uploadType=media): the request body is the raw
+        # RFC 5322 message, so no base64 or JSON wrapping is needed
+        sent = await google_client.execute(
+            google_client.messages.send(
                 userId="me",
-                body={"raw": raw},
+                media_body=MediaInMemoryUpload(mime_bytes, mimetype="message/rfc822"),
             )
-            .execute()
         )
 
         return {
@@ -111,79 +231,102 @@ async def send_mail(
 
 
 
-@mcp.tool(name="get_latest_message", description="Get the latest message from INBOX (subject, from, date, snippet, body)")
-async def get_latest_message(env_override: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+@mcp.tool(
+    name="get_latest_message",
+    description=(
+        "Get the latest message from INBOX (subject, from, date, snippet, body). "
+        "body_status is 'decoded' (text in body), 'deferred' (large body left as unpadded base64url "
+        "in body_b64url), 'skipped' (include_body=false) or 'missing' (no text body); "
+        "body and body_b64url are null when not used"
+    ),
+)
+async def get_latest_message(include_body: bool = True, env_override: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
     client = get_google_client(env_override)
-    gmail = client.gmail
     # list latest
-    lst = gmail.users().messages().list(userId="me", maxResults=1, labelIds=["INBOX"]).execute()
+    lst = await client.execute(client.messages.list(userId="me", maxResults=1, labelIds=["INBOX"], fields="messages/id"))
     messages = lst.get("messages") or []
     if not messages:
         return {"found": False}
     msg_id = messages[0]["id"]
-    msg = gmail.users().messages().get(userId="me", id=msg_id, format="full").execute()
+    if include_body:
+        request = client.messages.get(userId="me", id=msg_id, format="full", fields=_LATEST_MESSAGE_FIELDS)
+    else:
+        # metadata format: Gmail returns only the requested headers, without building the payload tree
+        request = client.messages.get(
+            userId="me", id=msg_id, format="metadata", metadataHeaders=["Subject", "From", "Date"],
+            fields=_LATEST_MESSAGE_HEADER_FIELDS,
+        )
+    msg = await client.execute(request)
     payload = msg.get("payload", {})
-    headers = {h.get("name"): h.get("value") for h in payload.get("headers", [])}
-    subject = headers.get("Subject")
-    from_hdr = headers.get("From")
-    date_hdr = headers.get("Date")
+    # walk headers once, stopping as soon as the three we need are found
+    wanted = {"Subject": None, "From": None, "Date": None}
+    remaining = len(wanted)
+    for h in payload.get("headers", ()):
+        name = h.get("name")
+        if name in wanted and wanted[name] is None:
+            wanted[name] = h.get("value")
+            remaining -= 1
+            if not remaining:
+                break
+    subject = wanted["Subject"]
+    from_hdr = wanted["From"]
+    date_hdr = wanted["Date"]
     snippet = msg.get("snippet")
 
-    # extract text/plain
-    body = None
-    parts = payload.get("parts")
-    if parts:
-        for p in parts:
-            if p.get("mimeType") == "text/plain":
-                data = p.get("body", {}).get("data")
-                if data:
-                    try:
-                        raw = __import__('base64').urlsafe_b64decode(data + "=" * ((4 - len(data) % 4) % 4))
-                        body = raw.decode("utf-8", errors="replace")
-                        break
-                    except Exception:
-                        body = ""
-    else:
-        data = payload.get("body", {}).get("data")
-        if data:
-            try:
-                raw = __import__('base64').urlsafe_b64decode(data + "=" * ((4 - len(data) % 4) % 4))
-                body = raw.decode("utf-8", errors="replace")
-            except Exception:
-                body = ""
-
-    return {
+    result = {
         "found": True,
         "id": msg_id,
         "subject": subject,
         "from": from_hdr,
         "date": date_hdr,
         "snippet": snippet,
-        "body": body,
+        "body": None,
+        "body_b64url": None,
+        "body_status": "skipped",
     }
+    if not include_body:
+        return result
+
+    text_part = _find_text_part(payload)
+    if text_part is None and _has_parts_below(payload, _PARTS_DEPTH):
+        # the text part may sit below the depth the fields selector expands; fetch the whole tree
+        full = await client.execute(client.messages.get(userId="me", id=msg_id, format="full"))
+        text_part = _find_text_part(full.get("payload", {}))
+    data = text_part.get("body", {}).get("data") if text_part is not None else None
+    if not data:
+        result["body_status"] = "missing"
+    elif len(data) * 3 // 4 > _MAX_DECODED_BODY:
+        # large bodies are passed through as Gmail's base64url so the caller decodes only if needed
+        result["body_b64url"] = data
+        result["body_status"] = "deferred"
+    else:
+        try:
+            raw = urlsafe_b64decode(data.encode("ascii") + _PAD[len(data) & 3])
+            result["body"] = raw.decode("utf-8", errors="replace")
+        except Exception:
+            result["body"] = ""
+        result["body_status"] = "decoded"
+    return result
 
 
 @mcp.tool(name="list_labels", description="List Gmail labels for the account")
 async def list_labels(env_override: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
     client = get_google_client(env_override)
-    gmail = client.gmail
-    resp = gmail.users().labels().list(userId="me").execute()
+    resp = await client.execute(client.labels.list(userId="me"))
     return resp
 
 
 @mcp.tool(name="create_label", description="Create a Gmail label. Provide {'name': 'LabelName'}")
 async def create_label(label: Dict[str, Any], env_override: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
     client = get_google_client(env_override)
-    gmail = client.gmail
-    resp = gmail.users().labels().create(userId="me", body=label).execute()
+    resp = await client.execute(client.labels.create(userId="me", body=label))
     return resp
 
 
 @mcp.tool(name="modify_message_labels", description="Modify labels on a message: {'addLabelIds': [...], 'removeLabelIds': [...]}")
 async def modify_message_labels(message_id: str, mods: Dict[str, Any], env_override: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
     client = get_google_client(env_override)
-    gmail = client.gmail
-    resp = gmail.users().messages().modify(userId="me", id=message_id, body=mods).execute()
+    resp = await client.execute(client.messages.modify(userId="me", id=message_id, body=mods))
     return resp
 
 
@@ -192,6 +335,33 @@ async def mark_read(message_id: str, env_override: Optional[Dict[str, str]] = No
     return await modify_message_labels(message_id, {"removeLabelIds": ["UNREAD"]}, env_override=env_override)
 
 
+@mcp.tool(
+    name="mark_read_many",
+    description="Mark several messages as read (remove UNREAD) in batched requests; on failure reports which ids were applied",
+)
+async def mark_read_many(message_ids: list[str], env_override: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    client = get_google_client(env_override)
+    ids = list(dict.fromkeys(message_ids))
+    applied: list[str] = []
+    # batchModify accepts up to 1000 ids per call; chunks are sent in order and stop at the first failure
+    for i in range(0, len(ids), _BATCH_MODIFY_LIMIT):
+        chunk = ids[i:i + _BATCH_MODIFY_LIMIT]
+        try:
+            await client.execute(client.messages.batchModify(
+                userId="me",
+                body={"ids": chunk, "removeLabelIds": ["UNREAD"]},
+            ))
+        except Exception as e:
+            return {
+                "isError": True,
+                "error": str(e),
+                "applied_ids": applied,
+                "failed_ids": ids[i:],
+            }
+        applied.extend(chunk)
+    return {"isError": False, "modified": len(applied), "applied_ids": applied}
+
+
 @mcp.tool(name="refresh_gmail_token", description="Ask backend to refresh the stored Gmail refresh_token for the current user")
 async def refresh_gmail_token(env_override: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
     """Calls the Paperslate API endpoint POST /api/connectors/gmail/refresh.
@@ -209,8 +379,7 @@ async def refresh_gmail_token(env_override: Optional[Dict[str, str]] = None) ->
 
     url = f"{base.rstrip('/')}/api/connectors/gmail/refresh"
     try:
-        import requests as _requests
-        resp = _requests.post(url, headers={"x-api-token": api_token}, timeout=20)
+        resp = await asyncio.to_thread(_backend_session.post, url, headers={"x-api-token": api_token}, timeout=20)
         try:
             data = resp.json()
         except Exception: